@@ -1,17 +1,31 @@
+import gzip
+import hashlib
+import heapq
+import http.client
 import json
 import mimetypes
 import os
+import queue
 import re
 import threading
 import time
 import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from urllib import error, parse, request
+from urllib import parse
 
 
 BASE_DIR = Path(__file__).resolve().parent
 PUBLIC_DIR = BASE_DIR / "public"
+# Sunulabilecek dosyalar acilista bir kez taranir; listede olmayan her yol 404 olur.
+PUBLIC_FILES = {
+  path.relative_to(PUBLIC_DIR).as_posix(): path.resolve()
+  for path in PUBLIC_DIR.rglob("*")
+  if path.is_file()
+}
 
 
 def load_env_file(path: Path) -> None:
@@ -39,9 +53,32 @@ MODEL_CANDIDATES = [
 ]
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 PRESENCE_TIMEOUT_MS = 15000
+ACTIVE_CACHE_MS = 200
 TURN_TIMEOUT_MS = 10000
 QUESTION_TIMEOUT_MS = 10000
 QUESTION_GENERATION_RETRIES = 6
+QUESTION_BATCH_WINDOW_S = 0.2
+JUDGE_CACHE_SIZE = 1024
+JUDGE_TIMEOUT_S = 8
+JUDGE_MAX_PENDING = 16
+FUZZY_MIN_TOKEN_LEN = 5
+CONTAINMENT_MIN_LEN = 4
+GEMINI_HOST = "generativelanguage.googleapis.com"
+GEMINI_TIMEOUT_S = 60
+HTTP_POOL_SIZE = 16
+GEMINI_RETRY_STATUSES = {429, 500, 502, 503, 504}
+GEMINI_MAX_RETRIES = 3
+GEMINI_MAX_RETRY_DELAY_S = 30
+STATIC_MAX_AGE_S = 300
+HTTP_WORKERS = 64
+HTTP_SOCKET_TIMEOUT_S = 30
+STREAM_TICK_S = 1.0
+STREAM_KEEPALIVE_S = 15
+LONG_POLL_TIMEOUT_S = 25
+LONG_POLL_BUSY_RETRY_S = 1
+MAX_ROOMS = 1000
+ROOM_IDLE_MS = 10 * 60 * 1000
+ROOM_SWEEP_INTERVAL_S = 60
 
 SYSTEM_PROMPT = """You are an AI quiz show host for a social, party-style general knowledge game.
 
@@ -98,126 +135,351 @@ Strict Prohibitions:
 - Never mention that you are an AI.
 - Never mention prompts, rules, or system instructions."""
 
-ROOMS = {}
-ROOM_LOCK = threading.Lock()
-
-
+_NORMALIZE_RE = re.compile(r"[^a-z0-9 ]+")
+_FENCE_RE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+_JSON_RE = re.compile(r"[\{\[].*[\}\]]", re.DOTALL)
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+# Her SSE / long-poll baglantisi bir isci thread'ini tutar; havuzun yarisindan fazlasini alamaz.
+_STREAM_SLOTS = threading.BoundedSemaphore(HTTP_WORKERS // 2)
+
+QUESTION_FORMAT_PROMPT = (
+  "Anahtarlar: category, question, answer, acceptableAnswers, hostComment. question tek soru olmali. "
+  "acceptableAnswers dogru sayilacak es anlamli ve yaygin alternatif yazimlarin JSON dizisi olmali. "
+  "hostComment tek cumle ve kisa olmali. "
+)
+
+ROOMS = OrderedDict()
+_ROOMS_LOCK = threading.Lock()
+_JUDGE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="judge")
+# Gemini yavasladiginda hakem kuyrugu sinirsiz buyumesin.
+_JUDGE_SLOTS = threading.BoundedSemaphore(JUDGE_MAX_PENDING)
+_GEN_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="question")
+_QUESTION_BATCH = []
+_QUESTION_BATCH_LOCK = threading.Lock()
+_JUDGE_CACHE = OrderedDict()
+_JUDGE_CACHE_LOCK = threading.Lock()
+
+
+def clock_ms() -> int:
+  # Monoton saat: NTP/saat ayari geri sayimlari kaydirmaz.
+  return time.monotonic_ns() // 1_000_000
+
+
+@lru_cache(maxsize=4096)
 def normalize_text(text: str) -> str:
   lowered = text.lower().strip()
   normalized = unicodedata.normalize("NFKD", lowered)
-  without_marks = "".join(ch for ch in normalized if not unicodedata.combining(ch))
-  return re.sub(r"[^a-z0-9 ]+", "", without_marks)
+  # ASCII disi karakterler regex ile zaten atiliyor; aksan isaretleri de tek adimda duser.
+  ascii_only = normalized.encode("ascii", "ignore").decode("ascii")
+  return _NORMALIZE_RE.sub("", ascii_only)
+
+
+def json_bytes(payload) -> bytes:
+  return _JSON_ENCODER.encode(payload).encode("utf-8")
 
 
 def parse_json_text(raw: str) -> dict:
   cleaned = raw.strip()
-  if cleaned.startswith("```"):
-    cleaned = cleaned.strip("`")
-    if cleaned.startswith("json"):
-      cleaned = cleaned[4:].strip()
-  return json.loads(cleaned)
+  fenced = _FENCE_RE.match(cleaned)
+  if fenced:
+    cleaned = fenced.group(1)
+  try:
+    return json.loads(cleaned)
+  except ValueError:
+    # Model JSON'un etrafina aciklama yazdiysa ilk {...} / [...] blogunu al.
+    found = _JSON_RE.search(cleaned)
+    if found is None:
+      raise
+    return json.loads(found.group(0))
+
+
+_LAST_GOOD_MODEL = [MODEL_CANDIDATES[0] if MODEL_CANDIDATES else MODEL]
+_HTTP_POOL = []
+_HTTP_POOL_LOCK = threading.Lock()
+
+
+def acquire_connection() -> http.client.HTTPSConnection:
+  with _HTTP_POOL_LOCK:
+    if _HTTP_POOL:
+      return _HTTP_POOL.pop()
+  return http.client.HTTPSConnection(GEMINI_HOST, timeout=GEMINI_TIMEOUT_S)
+
+
+def release_connection(conn: http.client.HTTPSConnection) -> None:
+  with _HTTP_POOL_LOCK:
+    if len(_HTTP_POOL) < HTTP_POOL_SIZE:
+      _HTTP_POOL.append(conn)
+      return
+  conn.close()
 
 
-def model_request(user_text: str, response_mime_type: str = "text/plain", temperature: float = 0.8) -> str:
+def gemini_post(path: str, body: bytes, timeout_s: float = GEMINI_TIMEOUT_S) -> tuple:
+  # Keep-alive: TLS el sikismasi surec basina bir kez yapilir, baglantilar havuzdan gelir.
+  for attempt in range(2):
+    conn = acquire_connection()
+    conn.timeout = timeout_s
+    if conn.sock is not None:
+      conn.sock.settimeout(timeout_s)
+    try:
+      conn.request(
+        "POST",
+        path,
+        body=body,
+        headers={"Content-Type": "application/json", "Connection": "keep-alive"},
+      )
+      resp = conn.getresponse()
+      data = resp.read()
+    except (http.client.HTTPException, ConnectionError):
+      conn.close()
+      # Havuzdaki baglanti sunucu tarafinda kapanmis olabilir; bir kez taze baglantiyla dene.
+      if attempt == 0:
+        continue
+      raise
+    except Exception:
+      conn.close()
+      raise
+    if resp.will_close:
+      conn.close()
+    else:
+      release_connection(conn)
+    return resp.status, resp.headers, data
+  raise RuntimeError("Gemini baglantisi kurulamadi")
+
+
+# Sabit sistem mesaji bir kez serilestirilir; her cagrida sadece degisen kisim eklenir.
+_SYSTEM_JSON_PREFIX = json_bytes({"systemInstruction": {"parts": [{"text": SYSTEM_PROMPT}]}})[:-1]
+
+
+def retry_delay_s(headers, attempt: int) -> float:
+  try:
+    delay = float(headers.get("Retry-After", ""))
+  except ValueError:
+    delay = float(2 ** attempt)
+  return min(max(delay, 0.0), GEMINI_MAX_RETRY_DELAY_S)
+
+
+def model_request(
+  user_text: str,
+  response_mime_type: str = "text/plain",
+  temperature: float = 0.8,
+  timeout_s: float = GEMINI_TIMEOUT_S,
+) -> str:
+  # timeout_s tum denemeler icin toplam butcedir.
+  deadline = time.monotonic() + timeout_s
   payload = {
-    "systemInstruction": {"parts": [{"text": SYSTEM_PROMPT}]},
     "contents": [{"role": "user", "parts": [{"text": user_text}]}],
     "generationConfig": {
       "temperature": temperature,
       "responseMimeType": response_mime_type,
     },
   }
+  body = _SYSTEM_JSON_PREFIX + b"," + json_bytes(payload)[1:]
 
-  last_error = ""
-  for model in MODEL_CANDIDATES:
-    req = request.Request(
-      f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={GEMINI_API_KEY}",
-      data=json.dumps(payload).encode("utf-8"),
-      headers={"Content-Type": "application/json"},
-      method="POST",
-    )
+  # 404 donen modeller her istekte tekrar denenmesin diye son calisan modelle basla.
+  preferred = _LAST_GOOD_MODEL[0]
+  candidates_order = [preferred] + [m for m in MODEL_CANDIDATES if m != preferred]
 
-    try:
-      with request.urlopen(req, timeout=60) as resp:
-        data = json.loads(resp.read().decode("utf-8"))
-      candidates = data.get("candidates", [])
-      if not candidates:
-        continue
-      parts = candidates[0].get("content", {}).get("parts", [])
-      texts = [part.get("text", "") for part in parts if part.get("text")]
-      text = "\n".join(texts).strip()
-      if text:
-        return text
-    except error.HTTPError as http_err:
-      body = http_err.read().decode("utf-8", errors="replace")
-      last_error = body
-      if http_err.code == 404:
+  last_error = ""
+  for model in candidates_order:
+    # 429/5xx gecicidir; ayni modeli bekleyerek tekrar dene (Retry-After varsa ona uy).
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+      remaining_s = deadline - time.monotonic()
+      if remaining_s <= 0:
+        raise TimeoutError("Gemini zaman asimi")
+      path = f"/v1beta/models/{model}:generateContent?key={GEMINI_API_KEY}"
+      status, headers, raw = gemini_post(path, body, timeout_s=remaining_s)
+      if status not in GEMINI_RETRY_STATUSES or attempt == GEMINI_MAX_RETRIES:
+        break
+      delay_s = retry_delay_s(headers, attempt)
+      if time.monotonic() + delay_s >= deadline:
+        break
+      time.sleep(delay_s)
+    if status != 200:
+      last_error = raw.decode("utf-8", errors="replace")
+      if status == 404:
         continue
-      raise RuntimeError(body)
+      raise RuntimeError(last_error)
+
+    _LAST_GOOD_MODEL[0] = model
+    data = json.loads(raw)
+    candidates = data.get("candidates", [])
+    if not candidates:
+      continue
+    parts = candidates[0].get("content", {}).get("parts", [])
+    texts = [part.get("text", "") for part in parts if part.get("text")]
+    text = "\n".join(texts).strip()
+    if text:
+      return text
 
   raise RuntimeError(last_error or "Gemini API model hatasi")
 
 
-def get_room(room_id: str) -> dict:
-  if room_id not in ROOMS:
-    ROOMS[room_id] = {
-      "players": {},
-      "presence": {},
-      "ready": set(),
-      "phase": "lobby",
-      "countdown_end_ms": 0,
-      "round": 0,
-      "current_question": None,
-      "events": [],
-      "seq": 0,
-      "generating": False,
-      "question_categories": [],
-      "question_fingerprints": [],
-      "recent_questions": [],
-    }
-  return ROOMS[room_id]
+def new_room() -> dict:
+  lock = threading.RLock()
+  return {
+    "lock": lock,
+    "cond": threading.Condition(lock),
+    "players": {},
+    "presence": {},
+    "presence_heap": [],
+    "active_cache": None,
+    "snapshot_cache": None,
+    "ready": set(),
+    "ready_list": [],
+    "scoreboard": [],
+    "phase": "lobby",
+    "countdown_end_ms": 0,
+    "round": 0,
+    "current_question": None,
+    "events": deque(maxlen=120),
+    "seq": 0,
+    "question_future": None,
+    "question_prefetched": False,
+    "question_categories": deque(maxlen=12),
+    "question_fingerprints": deque(maxlen=60),
+    "question_fingerprint_set": set(),
+    "recent_questions": deque(maxlen=20),
+    "last_ms": clock_ms(),
+  }
 
 
-def active_players(room: dict) -> list:
-  now_ms = int(time.time() * 1000)
-  return [
+def get_room(room_id: str) -> dict | None:
+  # ROOMS en son kullanilana gore sirali tutulur; en bastaki oda en uzun suredir bosta.
+  with _ROOMS_LOCK:
+    room = ROOMS.get(room_id)
+    if room is None:
+      # Kapasite doluysa yalnizca canli oyuncusu olmayan en eski oda cikarilir; suren oyun silinmez.
+      if len(ROOMS) >= MAX_ROOMS and not evict_idle_room():
+        return None
+      room = ROOMS[room_id] = new_room()
+    else:
+      ROOMS.move_to_end(room_id)
+    room["last_ms"] = clock_ms()
+    return room
+
+
+def has_live_presence(room: dict, now_ms: int) -> bool:
+  return any(now_ms - last_seen <= PRESENCE_TIMEOUT_MS for last_seen in list(room["presence"].values()))
+
+
+def evict_idle_room() -> bool:
+  # _ROOMS_LOCK tutulurken cagrilir.
+  now_ms = clock_ms()
+  idle_id = next((room_id for room_id, room in ROOMS.items() if not has_live_presence(room, now_ms)), None)
+  if idle_id is None:
+    return False
+  del ROOMS[idle_id]
+  return True
+
+
+def sweep_rooms() -> None:
+  now_ms = clock_ms()
+  cutoff = now_ms - ROOM_IDLE_MS
+  # Kontroller ROOMS kilidi altinda yapilir; ayni anda geri baglanan oyuncu odayi yeniden canlandirir.
+  with _ROOMS_LOCK:
+    for room_id, room in list(ROOMS.items()):
+      if room["last_ms"] >= cutoff:
+        break
+      if not has_live_presence(room, now_ms):
+        del ROOMS[room_id]
+
+
+def room_sweeper() -> None:
+  while True:
+    time.sleep(ROOM_SWEEP_INTERVAL_S)
+    sweep_rooms()
+
+
+def active_players(room: dict, now_ms: int | None = None) -> list:
+  if now_ms is None:
+    now_ms = clock_ms()
+  cached = room["active_cache"]
+  if cached is not None and now_ms - cached[0] <= ACTIVE_CACHE_MS:
+    return cached[1]
+  active = [
     name
     for name, last_seen in room["presence"].items()
     if now_ms - last_seen <= PRESENCE_TIMEOUT_MS and name in room["players"]
   ]
+  room["active_cache"] = (now_ms, active)
+  return active
+
 
+def mark_presence(room: dict, player: str, now_ms: int | None = None) -> None:
+  if now_ms is None:
+    now_ms = clock_ms()
+  if player not in room["presence"]:
+    room["active_cache"] = None
+  room["presence"][player] = now_ms
+  room["last_ms"] = now_ms
+  heapq.heappush(room["presence_heap"], (now_ms, player))
 
-def mark_presence(room: dict, player: str) -> None:
-  room["presence"][player] = int(time.time() * 1000)
 
+def drop_presence(room: dict, player: str) -> None:
+  if room["presence"].pop(player, None) is not None:
+    room["active_cache"] = None
 
-def reconcile_room_state(room: dict) -> None:
-  now_ms = int(time.time() * 1000)
-  for name, last_seen in list(room["presence"].items()):
-    if now_ms - last_seen > PRESENCE_TIMEOUT_MS:
-      room["presence"].pop(name, None)
-      room["ready"].discard(name)
 
-  active = active_players(room)
+def set_score(room: dict, player: str, score: int) -> None:
+  room["players"][player] = score
+  # seq olaysiz degisikliklerde de ilerler; istemci since=seq ile guncel olup olmadigini bildirir.
+  room["seq"] += 1
+  room["scoreboard"] = [
+    {"name": name, "score": value}
+    for name, value in sorted(room["players"].items(), key=lambda item: (-item[1], item[0]))
+  ]
+
+
+def set_ready(room: dict, names: set) -> None:
+  room["ready"] = names
+  room["seq"] += 1
+  room["ready_list"] = sorted(names)
+  room["cond"].notify_all()
+
+
+def reconcile_room_state(room: dict, now_ms: int | None = None) -> None:
+  if now_ms is None:
+    now_ms = clock_ms()
+  cutoff = now_ms - PRESENCE_TIMEOUT_MS
+  heap = room["presence_heap"]
+  expired = set()
+  # Heap'te eski isaretler de kalir; yalnizca oyuncunun son isaretiyle eslesen kayit dusurulur.
+  while heap and heap[0][0] < cutoff:
+    last_seen, name = heapq.heappop(heap)
+    if room["presence"].get(name) == last_seen:
+      del room["presence"][name]
+      expired.add(name)
+  if expired:
+    room["active_cache"] = None
+    if expired & room["ready"]:
+      set_ready(room, room["ready"] - expired)
+
+  active = active_players(room, now_ms)
   if room["phase"] in ["countdown", "question", "round_end"] and len(active) < 2:
     room["phase"] = "lobby"
     room["current_question"] = None
-    room["ready"] = set()
+    set_ready(room, set())
     room["countdown_end_ms"] = 0
-    room["generating"] = False
+    room["question_future"] = None
     add_event(room, "host", "Oyunculardan biri cikti. Tur sifirlandi, tekrar Hazir basin.")
     return
 
+  if room["phase"] in ["lobby", "round_end"]:
+    # Beklenen oyuncu ayrildi veya dustuyse kalanlar hazirsa tur baslar; aksi halde kimse tekrar Hazir basamaz.
+    if room["ready"] and can_start_round(room):
+      start_countdown(room)
+    return
+
   if room["phase"] == "question" and room["current_question"]:
     q = room["current_question"]
+    # Zamaninda gelen cevap degerlendirilirken sure islemez; hakem JUDGE_TIMEOUT_S ile sinirli.
+    if q.get("judging"):
+      return
     question_deadline_ms = int(q.get("question_deadline_ms", 0))
     if question_deadline_ms and now_ms >= question_deadline_ms:
       answer = q.get("answer", "")
       add_event(room, "host", f"Sure bitti. Dogru cevap: {answer}. 3 saniye sonra yeni soru.")
-      room["phase"] = "countdown"
-      room["countdown_end_ms"] = now_ms + 3000
-      room["current_question"] = None
-      room["generating"] = False
+      start_next_question_countdown(room, now_ms)
       return
 
     expected_player = q.get("expected_player", "")
@@ -225,59 +487,67 @@ def reconcile_room_state(room: dict) -> None:
     if expected_player and deadline_ms and now_ms >= deadline_ms:
       answer = q.get("answer", "")
       add_event(room, "host", f"{expected_player} sureyi doldurdu. Dogru cevap: {answer}. 3 saniye sonra yeni soru.")
-      room["phase"] = "countdown"
-      room["countdown_end_ms"] = now_ms + 3000
-      room["current_question"] = None
-      room["generating"] = False
+      start_next_question_countdown(room, now_ms)
 
 
 def add_event(room: dict, role: str, text: str) -> None:
   room["seq"] += 1
   room["events"].append({"id": room["seq"], "role": role, "text": text})
-  room["events"] = room["events"][-120:]
+  room["cond"].notify_all()
 
 
 def start_countdown(room: dict) -> None:
   room["round"] += 1
   room["phase"] = "countdown"
-  room["countdown_end_ms"] = int(time.time() * 1000) + 10000
+  room["countdown_end_ms"] = clock_ms() + 10000
   room["current_question"] = None
-  room["ready"] = set()
-  room["generating"] = False
+  set_ready(room, set())
+  # Soru geri sayim suresince arka planda hazirlanir.
+  schedule_question(room, prefetched=True)
   add_event(room, "host", f"Tur {room['round']} basliyor. 10 saniye...")
 
 
+def start_next_question_countdown(room: dict, now_ms: int) -> None:
+  room["phase"] = "countdown"
+  room["countdown_end_ms"] = now_ms + 3000
+  room["current_question"] = None
+  # Bir sonraki soru 3 saniyelik ara sirasinda hazirlanir.
+  schedule_question(room, prefetched=True)
+
+
 def can_start_round(room: dict) -> bool:
   player_names = active_players(room)
   return len(player_names) >= 2 and all(name in room["ready"] for name in player_names)
 
 
-def generate_question_payload(room: dict) -> dict:
-  recent = ", ".join(room["question_categories"][-4:]) or "(yok)"
-  banned_fps = set(room.get("question_fingerprints", []))
-  recent_questions = room.get("recent_questions", [])[-8:]
+def is_fresh_question(data, banned_fps: set) -> bool:
+  if not isinstance(data, dict) or not data.get("question") or not data.get("answer"):
+    return False
+  fingerprint = normalize_text(str(data["question"]).strip())
+  return bool(fingerprint) and fingerprint not in banned_fps
+
+
+def generate_question_payload(history: dict) -> dict:
+  recent = ", ".join(history["question_categories"][-4:]) or "(yok)"
+  banned_fps = history["banned_fingerprints"]
+  recent_questions = history["recent_questions"][-8:]
   recent_text = " | ".join(recent_questions) if recent_questions else "(yok)"
 
   for _ in range(QUESTION_GENERATION_RETRIES):
     prompt = (
-      "Yeni bir quiz sorusu uret. Sadece JSON don. Anahtarlar: "
-      "category, question, answer, hostComment. question tek soru olmali. "
-      "hostComment tek cumle ve kisa olmali. "
+      "Yeni bir quiz sorusu uret. Sadece JSON don. "
+      f"{QUESTION_FORMAT_PROMPT}"
       "ASLA asagidaki sorulara benzer veya ayni soru uretme: "
       f"{recent_text}. Son kategoriler: {recent}."
     )
     raw = model_request(prompt, response_mime_type="application/json", temperature=0.9)
-    data = parse_json_text(raw)
+    try:
+      data = parse_json_text(raw)
+    except ValueError:
+      continue
     if isinstance(data, list):
       data = data[0] if data and isinstance(data[0], dict) else {}
-    if not isinstance(data, dict):
-      data = {}
-    if not data.get("question") or not data.get("answer"):
-      continue
-
-    q_text = str(data["question"]).strip()
-    fingerprint = normalize_text(q_text)
-    if not fingerprint or fingerprint in banned_fps:
+    if not is_fresh_question(data, banned_fps):
       continue
 
     return data
@@ -291,62 +561,239 @@ def generate_question_payload(room: dict) -> dict:
   }
 
 
-def ensure_round_question(room_id: str) -> None:
-  with ROOM_LOCK:
-    room = get_room(room_id)
-    now_ms = int(time.time() * 1000)
-    if room["phase"] != "countdown" or now_ms < room["countdown_end_ms"] or room["generating"]:
-      return
-    room["generating"] = True
+def generate_question_batch(histories: list) -> list:
+  categories = dict.fromkeys(c for h in histories for c in h["question_categories"][-4:])
+  recent_questions = dict.fromkeys(q for h in histories for q in h["recent_questions"][-8:])
+  recent = ", ".join(categories) or "(yok)"
+  recent_text = " | ".join(recent_questions) or "(yok)"
+  prompt = (
+    f"Birbirinden farkli {len(histories)} quiz sorusu uret. Sadece JSON dizi don, her eleman bir soru nesnesi. "
+    f"{QUESTION_FORMAT_PROMPT}"
+    "ASLA asagidaki sorulara benzer veya ayni soru uretme: "
+    f"{recent_text}. Son kategoriler: {recent}."
+  )
+  raw = model_request(prompt, response_mime_type="application/json", temperature=0.9)
+  data = parse_json_text(raw)
+  if isinstance(data, dict):
+    data = [data]
+  if not isinstance(data, list):
+    return []
+  return [item for item in data if isinstance(item, dict)]
+
 
-  question_obj = None
-  error_text = ""
+def fill_question_future(future: Future, history: dict) -> None:
   try:
-    question_obj = generate_question_payload(room)
+    future.set_result(generate_question_payload(history))
   except Exception as exc:
-    error_text = str(exc)
+    future.set_exception(exc)
 
-  with ROOM_LOCK:
-    room = get_room(room_id)
-    room["generating"] = False
-    if error_text:
+
+def flush_question_batch() -> None:
+  with _QUESTION_BATCH_LOCK:
+    batch = list(_QUESTION_BATCH)
+    _QUESTION_BATCH.clear()
+
+  questions = []
+  if len(batch) > 1:
+    try:
+      questions = generate_question_batch([history for _, history in batch])
+    except Exception:
+      questions = []
+
+  for future, history in batch:
+    banned_fps = history["banned_fingerprints"]
+    match = next((q for q in questions if is_fresh_question(q, banned_fps)), None)
+    if match is None:
+      # Toplu cevaptan uygun soru cikmadiysa bu oda icin tekil istek at.
+      _GEN_POOL.submit(fill_question_future, future, history)
+      continue
+    questions.remove(match)
+    future.set_result(match)
+
+
+def request_question(history: dict) -> Future:
+  # Ayni pencerede biten geri sayimlar tek Gemini cagrisinda toplanir.
+  future = Future()
+  with _QUESTION_BATCH_LOCK:
+    _QUESTION_BATCH.append((future, history))
+    first = len(_QUESTION_BATCH) == 1
+  if first:
+    timer = threading.Timer(QUESTION_BATCH_WINDOW_S, flush_question_batch)
+    timer.daemon = True
+    timer.start()
+  return future
+
+
+def schedule_question(room: dict, prefetched: bool) -> None:
+  # Uretim baska thread'de calisir; oda durumunun kopyasi tur basina bir kez alinir.
+  history = {
+    "question_categories": list(room["question_categories"]),
+    "recent_questions": list(room["recent_questions"]),
+    "banned_fingerprints": frozenset(room["question_fingerprint_set"]),
+  }
+  room["question_future"] = request_question(history)
+  room["question_prefetched"] = prefetched
+
+
+def ensure_round_question(room: dict, now_ms: int) -> None:
+  with room["lock"]:
+    if room["phase"] != "countdown" or now_ms < room["countdown_end_ms"]:
+      return
+
+    future = room["question_future"]
+    if future is None:
+      schedule_question(room, prefetched=False)
+      return
+    if not future.done():
+      return
+
+    room["question_future"] = None
+    try:
+      question_obj = future.result()
+    except Exception as exc:
+      if room["question_prefetched"]:
+        schedule_question(room, prefetched=False)
+        return
       room["phase"] = "lobby"
-      add_event(room, "host", f"Soru olusturulamadi: {error_text[:120]}")
+      add_event(room, "host", f"Soru olusturulamadi: {str(exc)[:120]}")
       return
 
     room["phase"] = "question"
     q_text = question_obj["question"].strip()
     q_fp = normalize_text(q_text)
-    if q_fp:
-      room["question_fingerprints"].append(q_fp)
-      room["question_fingerprints"] = room["question_fingerprints"][-60:]
+    fingerprints = room["question_fingerprints"]
+    fingerprint_set = room["question_fingerprint_set"]
+    if q_fp and q_fp not in fingerprint_set:
+      if len(fingerprints) == fingerprints.maxlen:
+        fingerprint_set.discard(fingerprints[0])
+      fingerprints.append(q_fp)
+      fingerprint_set.add(q_fp)
     room["recent_questions"].append(q_text)
-    room["recent_questions"] = room["recent_questions"][-20:]
+
+    answer = question_obj["answer"].strip()
+    alternates = question_obj.get("acceptableAnswers")
+    if not isinstance(alternates, list):
+      alternates = []
+    accepted = [normalize_text(str(item)) for item in [answer, *alternates]]
 
     room["current_question"] = {
       "question": q_text,
-      "answer": question_obj["answer"].strip(),
+      "answer": answer,
+      "canonical": normalize_text(answer),
+      "accepted": tuple(dict.fromkeys(item for item in accepted if item)),
       "hostComment": (question_obj.get("hostComment") or "Hadi bakalim.").strip(),
       "category": (question_obj.get("category") or "Karisik").strip(),
       "winner": "",
       "expected_player": "",
       "attempt_order": [],
+      "judging": "",
+      "judge_cache": {},
       "turn_deadline_ms": 0,
-      "question_deadline_ms": int(time.time() * 1000) + QUESTION_TIMEOUT_MS,
+      "question_deadline_ms": now_ms + QUESTION_TIMEOUT_MS,
     }
     room["question_categories"].append(room["current_question"]["category"])
-    room["question_categories"] = room["question_categories"][-12:]
     add_event(room, "host", room["current_question"]["question"])
     add_event(room, "host", room["current_question"]["hostComment"])
 
 
-def evaluate_answer(question: str, canonical_answer: str, player_answer: str) -> bool:
-  na = normalize_text(canonical_answer)
+def local_verdict(canonical: str, accepted: tuple, player_answer: str) -> bool | None:
   pa = normalize_text(player_answer)
   if not pa:
     return False
-  if pa == na or pa in na or na in pa:
+  if pa in accepted:
+    return True
+  # Tek harflik cevap icerme/benzerlik kurallarina hic girmez; "7" gibi rakamlar hakeme kalir.
+  if len(pa) < 2 and not pa.isdigit():
+    return False
+  # Latin harfli karsiligi olmayan cevaplar ("π" gibi) yerelde karara baglanamaz.
+  if not accepted:
+    return None
+  # Icerme yalnizca asil cevap icin; "ABD" / "US" gibi kisa alternatifler her seyle eslesmesin.
+  if canonical and contains_answer(pa, canonical):
+    return True
+  if any(is_close_match(pa, na) for na in accepted):
+    return True
+  if all(is_obvious_miss(pa, na) for na in accepted):
+    return False
+  return None
+
+
+def contains_answer(pa: str, na: str) -> bool:
+  # "mustafa kemal ataturk" / "ataturk": kisa olan, uzun olanin icinde butun kelimeler olarak gecmeli.
+  if any(ch.isdigit() for ch in pa + na):
+    return False
+  shorter, longer = sorted([pa.split(), na.split()], key=lambda tokens: len(" ".join(tokens)))
+  if len(" ".join(shorter)) < CONTAINMENT_MIN_LEN:
+    return False
+  size = len(shorter)
+  return any(longer[i:i + size] == shorter for i in range(len(longer) - size + 1))
+
+
+def within_one_edit(a: str, b: str) -> bool:
+  # Tek harf ekleme/silme/degistirme veya yan yana iki harfin yer degistirmesi.
+  if abs(len(a) - len(b)) > 1:
+    return False
+  if len(a) > len(b):
+    a, b = b, a
+  i = 0
+  while i < len(a) and a[i] == b[i]:
+    i += 1
+  if len(a) < len(b):
+    return a[i:] == b[i + 1:]
+  if a[i + 1:] == b[i + 1:]:
+    return True
+  return a[i:i + 2] == b[i + 1:i + 2] + b[i:i + 1] and a[i + 2:] == b[i + 2:]
+
+
+def tokens_close(pa_tokens: list, na_tokens: list) -> bool:
+  return all(
+    pt == nt or (min(len(pt), len(nt)) >= FUZZY_MIN_TOKEN_LEN and within_one_edit(pt, nt))
+    for pt, nt in zip(pa_tokens, na_tokens)
+  )
+
+
+def is_close_match(pa: str, na: str) -> bool:
+  # "istanbull" / "istanbul" gibi yazim hatalari hakeme gitmeden kabul edilir.
+  # Rakamlarda tek karakter farki baska bir cevaptir ("1 milyon 300 bin" / "1 milyon 200 bin").
+  if any(ch.isdigit() for ch in pa + na):
+    return False
+  pa_tokens, na_tokens = pa.split(), na.split()
+  if len(pa_tokens) != len(na_tokens):
+    return False
+  # Kelime basina karsilastirilir: "birinci" / "ikinci" gibi kisa farklar tum metin oraninda kaybolmasin.
+  if tokens_close(pa_tokens, na_tokens):
+    return True
+  # Cok kelimeli cevaplarda kelime sirasi onemsiz.
+  return len(na_tokens) > 1 and tokens_close(sorted(pa_tokens), sorted(na_tokens))
+
+
+def is_obvious_miss(pa: str, na: str) -> bool:
+  # Rakamli cevaplar yaziyla da verilebilir ("7" / "yedi"); iki yonde de hakeme birak.
+  if any(ch.isdigit() for ch in pa + na):
+    return False
+  la, lna = len(pa), len(na)
+  if la > 4 * lna or lna > 4 * la:
     return True
+  return not (set(pa) & set(na)) - {" "}
+
+
+def cached_verdict(judge_cache: dict, player_answer: str) -> bool | None:
+  pa = normalize_text(player_answer)
+  if pa in judge_cache:
+    return judge_cache[pa]
+  # "pariz" / "parys" gibi yazim farklari ayni hakem kararini paylasir; kural yerel eslesmeyle ayni.
+  for judged, verdict in judge_cache.items():
+    if is_close_match(pa, judged):
+      return verdict
+  return None
+
+
+def judge_answer(question: str, canonical_answer: str, player_answer: str) -> bool | None:
+  cache_key = (question, normalize_text(player_answer))
+  with _JUDGE_CACHE_LOCK:
+    if cache_key in _JUDGE_CACHE:
+      _JUDGE_CACHE.move_to_end(cache_key)
+      return _JUDGE_CACHE[cache_key]
 
   judge_prompt = (
     "Sadece JSON don. Anahtarlar: correct (boolean).\n"
@@ -356,19 +803,193 @@ def evaluate_answer(question: str, canonical_answer: str, player_answer: str) ->
     "Es anlamli veya yaygin alternatif dogruysa true don."
   )
   try:
-    raw = model_request(judge_prompt, response_mime_type="application/json", temperature=0.1)
+    raw = model_request(
+      judge_prompt,
+      response_mime_type="application/json",
+      temperature=0.1,
+      timeout_s=JUDGE_TIMEOUT_S,
+    )
     data = parse_json_text(raw)
     if isinstance(data, list):
       data = data[0] if data and isinstance(data[0], dict) else {}
     if not isinstance(data, dict):
       data = {}
-    return bool(data.get("correct", False))
+    correct = bool(data.get("correct", False))
   except Exception:
+    # Gecici hatalar onbellege yazilmaz.
+    return None
+
+  with _JUDGE_CACHE_LOCK:
+    _JUDGE_CACHE[cache_key] = correct
+    if len(_JUDGE_CACHE) > JUDGE_CACHE_SIZE:
+      _JUDGE_CACHE.popitem(last=False)
+  return correct
+
+
+def apply_answer_result(room: dict, active_q: dict, player: str, correct: bool) -> None:
+  now_ms = clock_ms()
+  if correct:
+    set_score(room, player, room["players"].get(player, 0) + 1)
+    active_q["winner"] = player
+    score_line = " | ".join([f"{name}: {score}" for name, score in room["players"].items()])
+    add_event(room, "host", f"Dogru! Turu {player} aldi. (+1 puan)")
+    add_event(room, "host", f"Skor: {score_line}")
+    add_event(room, "host", "3 saniye sonra yeni soru.")
+    start_next_question_countdown(room, now_ms)
+    return
+
+  attempts = active_q.setdefault("attempt_order", [])
+  attempts.append(player)
+  add_event(room, "host", "Yanlis cevap.")
+
+  other_players = [name for name in active_players(room) if name != player]
+  next_player = other_players[0] if other_players else ""
+
+  if next_player and next_player not in attempts:
+    active_q["expected_player"] = next_player
+    active_q["turn_deadline_ms"] = now_ms + TURN_TIMEOUT_MS
+    add_event(room, "host", f"{player} bilemedi. Sira {next_player} oyuncusunda.")
+  else:
+    answer = active_q.get("answer", "")
+    add_event(room, "host", f"Iki taraf da bilemedi. Dogru cevap: {answer}. 3 saniye sonra yeni soru.")
+    start_next_question_countdown(room, now_ms)
+
+
+def settle_answer(room: dict, active_q: dict, player: str, correct: bool) -> None:
+  active_q["judging"] = ""
+  # Karar gelene kadar sure dolmus veya soru degismis olabilir.
+  if room["phase"] != "question" or room["current_question"] is not active_q:
+    return
+  apply_answer_result(room, active_q, player, correct)
+
+
+def resolve_judged_answer(room: dict, active_q: dict, player: str, answer_text: str) -> None:
+  verdict = judge_answer(active_q["question"], active_q["answer"], answer_text)
+
+  # Oda bu arada silinmis olabilir; yenisini yaratmak yerine eldeki nesneye yazilir.
+  with room["lock"]:
+    if verdict is not None:
+      active_q["judge_cache"][normalize_text(answer_text)] = verdict
+    settle_answer(room, active_q, player, bool(verdict))
+
+
+def claim_answer(room: dict, player: str, answer_text: str, now_ms: int) -> tuple:
+  mark_presence(room, player, now_ms)
+  reconcile_room_state(room, now_ms)
+  if room["phase"] != "question" or not room["current_question"]:
+    return None, {"error": "Su an soru asamasi degil", "state": room_snapshot(room)}
+  active_q = room["current_question"]
+  attempts = active_q.setdefault("attempt_order", [])
+  if player in attempts:
+    return None, {"error": "Yanlis cevap. Bu tur tekrar cevap veremezsin.", "state": room_snapshot(room)}
+
+  judging = active_q.get("judging", "")
+  if judging:
+    return None, {"error": f"{judging} oyuncusunun cevabi degerlendiriliyor.", "state": room_snapshot(room)}
+
+  expected_player = active_q.get("expected_player", "")
+  if expected_player and expected_player != player:
+    return None, {"error": f"Sira {expected_player} oyuncusunda.", "state": room_snapshot(room)}
+  if not expected_player:
+    active_q["expected_player"] = player
+
+  add_event(room, "system", f"{player}: {answer_text}")
+  # Karar kilit disinda verilirken soru bu oyuncuya ayrilir.
+  active_q["judging"] = player
+  return active_q, None
+
+
+def parse_query(query: str) -> dict:
+  # parse_qs'in liste sozlugu yerine tek degerli, son gelen kazanir.
+  params = {}
+  for pair in query.split("&"):
+    if not pair:
+      continue
+    key, _, value = pair.partition("=")
+    if "%" in value or "+" in value:
+      value = parse.unquote_plus(value)
+    params[key] = value
+  return params
+
+
+def state_query(query: str) -> tuple:
+  params = parse_query(query)
+  room_id = params.get("roomId", "").strip().lower()
+  player = params.get("playerName", "").strip()
+  try:
+    since = int(params.get("since") or 0)
+  except ValueError:
+    since = 0
+  wait = params.get("wait") == "1"
+  return room_id, player, since, wait
+
+
+def poll_room(room: dict, player: str, revive: bool = True) -> None:
+  now_ms = clock_ms()
+  # Acik baglantinin sonraki turlari yalnizca hala bagli oyuncuyu yeniler; /api/leave geri alinmaz.
+  known = room["players"] if revive else room["presence"]
+  with room["lock"]:
+    if player and player in known:
+      mark_presence(room, player, now_ms)
+    reconcile_room_state(room, now_ms)
+    # Faz gecisi yalnizca burada olur; ikinci bir reconcile gerekmez.
+    ensure_round_question(room, now_ms)
+
+
+def wait_for_change(room_id: str, room: dict, player: str, since: int) -> None:
+  with room["lock"]:
+    start_etag = snapshot_etag(room_id, room, since)
+  deadline = time.monotonic() + LONG_POLL_TIMEOUT_S
+  while time.monotonic() < deadline:
+    with room["lock"]:
+      if room["seq"] > since or snapshot_etag(room_id, room, since) != start_etag:
+        return
+      room["cond"].wait(timeout=STREAM_TICK_S)
+    room = get_room(room_id)
+    if room is None:
+      return
+    poll_room(room, player, revive=False)
+
+
+def poll_is_quiet(room: dict, since: int, now_ms: int) -> bool:
+  # Istemci son durumu gormusse ve vadesi gelen sure/varlik yoksa reconcile'a gerek yok.
+  if since <= 0 or since != room["seq"]:
+    return False
+  heap = room["presence_heap"]
+  # Yeni isaretle gecersiz kalmis kayitlar atilir; yalnizca gercek bir zaman asimi hizli yolu bozar.
+  while heap and room["presence"].get(heap[0][1]) != heap[0][0]:
+    heapq.heappop(heap)
+  if heap and heap[0][0] < now_ms - PRESENCE_TIMEOUT_MS:
+    return False
+  if room["phase"] == "countdown" and now_ms >= room["countdown_end_ms"]:
     return False
+  question = room["current_question"]
+  if room["phase"] == "question" and question:
+    for key in ["question_deadline_ms", "turn_deadline_ms"]:
+      if question[key] and now_ms >= question[key]:
+        return False
+  return True
+
+
+def quiet_state(room: dict, player: str, since: int, revive: bool = True) -> dict | None:
+  now_ms = clock_ms()
+  with room["lock"]:
+    if not poll_is_quiet(room, since, now_ms):
+      return None
+    known = room["players"] if revive else room["presence"]
+    if player and player in known:
+      mark_presence(room, player, now_ms)
+    remaining, question_remaining = remaining_seconds(room, now_ms)
+    return {
+      "seq": room["seq"],
+      "nowMs": now_ms,
+      "unchanged": True,
+      "countdown": remaining,
+      "questionCountdown": question_remaining,
+    }
 
 
-def room_snapshot(room: dict) -> dict:
-  now_ms = int(time.time() * 1000)
+def remaining_seconds(room: dict, now_ms: int) -> tuple:
   remaining = 0
   if room["phase"] == "countdown":
     remaining = max(0, int((room["countdown_end_ms"] - now_ms + 999) / 1000))
@@ -376,11 +997,49 @@ def room_snapshot(room: dict) -> dict:
   if room["phase"] == "question" and room.get("current_question"):
     deadline = int(room["current_question"].get("question_deadline_ms", 0))
     question_remaining = max(0, int((deadline - now_ms + 999) / 1000))
+  return remaining, question_remaining
+
+
+def snapshot_key(room: dict, since: int, now_ms: int) -> tuple:
+  # Snapshot yalnizca olay sirasi, faz, gorunen geri sayim veya hazir listesi degisince degisir.
+  remaining, question_remaining = remaining_seconds(room, now_ms)
+  return since, room["seq"], room["phase"], remaining, question_remaining, len(room["ready"])
+
+
+def snapshot_etag(room_id: str, room: dict, since: int = 0) -> str:
+  key = snapshot_key(room, since, clock_ms())
+  return f'W/"{room_id}-' + "-".join(str(part) for part in key) + '"'
 
-  scores = [
-    {"name": name, "score": score}
-    for name, score in sorted(room["players"].items(), key=lambda item: (-item[1], item[0]))
-  ]
+
+def snapshot_body(room: dict, since: int = 0) -> bytes:
+  now_ms = clock_ms()
+  with room["lock"]:
+    # Ayni yarim saniyede ayni yeri soran istemciler ayni JSON govdesini paylasir.
+    key = (*snapshot_key(room, since, now_ms), now_ms // 500)
+    cached = room["snapshot_cache"]
+    if cached is not None and cached[0] == key:
+      return cached[1]
+    state = room_snapshot(room, since)
+  raw = json_bytes(state)
+  room["snapshot_cache"] = (key, raw)
+  return raw
+
+
+def events_since(room: dict, since: int) -> list:
+  if since <= 0:
+    return list(room["events"])
+  fresh = []
+  for event in reversed(room["events"]):
+    if event["id"] <= since:
+      break
+    fresh.append(event)
+  fresh.reverse()
+  return fresh
+
+
+def room_snapshot(room: dict, since: int = 0) -> dict:
+  now_ms = clock_ms()
+  remaining, question_remaining = remaining_seconds(room, now_ms)
 
   question = room.get("current_question")
   question_public = None
@@ -390,6 +1049,7 @@ def room_snapshot(room: dict) -> dict:
       "hostComment": question.get("hostComment", ""),
       "winner": question.get("winner", ""),
       "category": question.get("category", ""),
+      "judging": question.get("judging", ""),
     }
 
   return {
@@ -397,62 +1057,180 @@ def room_snapshot(room: dict) -> dict:
     "round": room["round"],
     "countdown": remaining,
     "questionCountdown": question_remaining,
-    "scores": scores,
-    "ready": sorted(list(room["ready"])),
-    "events": room["events"],
+    "scores": room["scoreboard"],
+    "ready": room["ready_list"],
+    "seq": room["seq"],
+    "events": events_since(room, since),
     "question": question_public,
     "nowMs": now_ms,
   }
 
 
+def load_static(file_path: Path) -> tuple:
+  raw = file_path.read_bytes()
+  compressed = gzip.compress(raw, 9)
+  ctype, _ = mimetypes.guess_type(file_path.name)
+  return (
+    raw,
+    compressed if len(compressed) < len(raw) else None,
+    f'"{hashlib.sha1(raw).hexdigest()}"',
+    ctype or "application/octet-stream",
+  )
+
+
+# Statik dosyalar acilista bir kez okunur ve sikistirilir; istek basina dosya sistemine gidilmez.
+STATIC_FILES = {rel: load_static(path) for rel, path in PUBLIC_FILES.items()}
+
+
 class Handler(BaseHTTPRequestHandler):
-  def _send_json(self, status: int, payload: dict) -> None:
-    raw = json.dumps(payload).encode("utf-8")
+  timeout = HTTP_SOCKET_TIMEOUT_S
+
+  def _send_json(self, status: int, payload: dict | bytes, etag: str = "", retry_after_s: int = 0) -> None:
+    raw = payload if isinstance(payload, bytes) else json_bytes(payload)
     self.send_response(status)
     self.send_header("Content-Type", "application/json; charset=utf-8")
     self.send_header("Content-Length", str(len(raw)))
+    if retry_after_s:
+      self.send_header("Retry-After", str(retry_after_s))
+    if etag:
+      self.send_header("ETag", etag)
+      self.send_header("Cache-Control", "no-cache")
     self.end_headers()
     self.wfile.write(raw)
 
+  def _room(self, room_id: str) -> dict | None:
+    room = get_room(room_id)
+    if room is None:
+      self._send_json(503, {"error": "Oda kapasitesi dolu"})
+    return room
+
   def _serve_public(self, target: str) -> None:
     clean = target.split("?", 1)[0]
     rel = clean.lstrip("/") or "index.html"
-    file_path = (PUBLIC_DIR / rel).resolve()
-    if not str(file_path).startswith(str(PUBLIC_DIR)) or not file_path.exists() or not file_path.is_file():
+    entry = STATIC_FILES.get(rel)
+    if entry is None:
       self.send_error(404, "Not found")
       return
 
-    data = file_path.read_bytes()
-    ctype, _ = mimetypes.guess_type(str(file_path))
+    raw, compressed, etag, ctype = entry
+    cache_control = f"public, max-age={STATIC_MAX_AGE_S}"
+    if self.headers.get("If-None-Match") == etag:
+      self.send_response(304)
+      self.send_header("ETag", etag)
+      self.send_header("Cache-Control", cache_control)
+      self.end_headers()
+      return
+
+    data = raw
+    use_gzip = compressed is not None and "gzip" in (self.headers.get("Accept-Encoding") or "")
+    if use_gzip:
+      data = compressed
     self.send_response(200)
-    self.send_header("Content-Type", f"{ctype or 'application/octet-stream'}")
+    self.send_header("Content-Type", ctype)
     self.send_header("Content-Length", str(len(data)))
+    self.send_header("Cache-Control", cache_control)
+    self.send_header("ETag", etag)
+    self.send_header("Vary", "Accept-Encoding")
+    if use_gzip:
+      self.send_header("Content-Encoding", "gzip")
     self.end_headers()
     self.wfile.write(data)
 
+  def _stream_state(self, room_id: str, player: str, since: int) -> None:
+    self.send_response(200)
+    self.send_header("Content-Type", "text/event-stream")
+    self.send_header("Cache-Control", "no-cache")
+    self.end_headers()
+
+    sent_etag = ""
+    last_write = time.monotonic()
+    first_tick = True
+    try:
+      while True:
+        # Oyun akisi sorgularla ilerler; stream de her turda ayni adimlari calistirir.
+        room = get_room(room_id)
+        if room is None:
+          return
+        poll_room(room, player, revive=first_tick)
+        first_tick = False
+        body_since = -1
+        with room["lock"]:
+          if snapshot_etag(room_id, room, since) != sent_etag:
+            body_since = since
+            since = room["seq"]
+            sent_etag = snapshot_etag(room_id, room, since)
+          else:
+            room["cond"].wait(timeout=STREAM_TICK_S)
+
+        chunk = b""
+        if body_since >= 0:
+          chunk = b"data: " + snapshot_body(room, body_since) + b"\n\n"
+        elif time.monotonic() - last_write >= STREAM_KEEPALIVE_S:
+          chunk = b": ping\n\n"
+        if chunk:
+          self.wfile.write(chunk)
+          self.wfile.flush()
+          last_write = time.monotonic()
+    except (BrokenPipeError, ConnectionResetError, TimeoutError):
+      return
+
   def do_GET(self):
     parsed = parse.urlparse(self.path)
 
-    if parsed.path == "/api/state":
-      params = parse.parse_qs(parsed.query)
-      room_id = (params.get("roomId", [""])[0] or "").strip().lower()
-      player = (params.get("playerName", [""])[0] or "").strip()
+    if parsed.path in ["/api/state", "/api/stream"]:
+      room_id, player, since, wait = state_query(parsed.query)
       if not room_id:
         self._send_json(400, {"error": "roomId gerekli"})
         return
 
-      with ROOM_LOCK:
-        room = get_room(room_id)
-        if player and player in room["players"]:
-          mark_presence(room, player)
-        reconcile_room_state(room)
+      if parsed.path == "/api/stream":
+        if not _STREAM_SLOTS.acquire(blocking=False):
+          self._send_json(503, {"error": "Canli baglanti kapasitesi dolu"})
+          return
+        try:
+          self._stream_state(room_id, player, since)
+        finally:
+          _STREAM_SLOTS.release()
+        return
 
-      ensure_round_question(room_id)
+      room = self._room(room_id)
+      if room is None:
+        return
+      # Long-poll hemen donmesin diye bekleyen istekler once beklemeye girer.
+      state = None if wait else quiet_state(room, player, since)
+      retry_after_s = 0
+      if state is None:
+        poll_room(room, player)
+        # Long-poll: yeni olay, faz veya gorunen sayac degisene kadar beklet.
+        if wait and not _STREAM_SLOTS.acquire(blocking=False):
+          # Bekletecek yer yok; istemci hemen tekrar sormasin, yavaslasin.
+          retry_after_s = LONG_POLL_BUSY_RETRY_S
+          state = quiet_state(room, player, since)
+        elif wait:
+          try:
+            wait_for_change(room_id, room, player, since)
+          finally:
+            _STREAM_SLOTS.release()
+          room = self._room(room_id)
+          if room is None:
+            return
+          # Bekleme sirasinda /api/leave gelmis olabilir; oyuncu geri getirilmez.
+          state = quiet_state(room, player, since, revive=False)
+      if state is not None:
+        self._send_json(200, state, retry_after_s=retry_after_s)
+        return
 
-      with ROOM_LOCK:
-        room = get_room(room_id)
-        reconcile_room_state(room)
-        self._send_json(200, room_snapshot(room))
+      with room["lock"]:
+        etag = snapshot_etag(room_id, room, since)
+      if self.headers.get("If-None-Match") == etag:
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if retry_after_s:
+          self.send_header("Retry-After", str(retry_after_s))
+        self.end_headers()
+        return
+      self._send_json(200, snapshot_body(room, since), etag=etag, retry_after_s=retry_after_s)
       return
 
     if parsed.path.startswith("/api/"):
@@ -465,7 +1243,7 @@ class Handler(BaseHTTPRequestHandler):
     length = int(self.headers.get("Content-Length", "0"))
     body = self.rfile.read(length)
     try:
-      payload = json.loads(body.decode("utf-8"))
+      payload = json.loads(body)
     except Exception:
       self._send_json(400, {"error": "Gecersiz JSON"})
       return
@@ -480,14 +1258,18 @@ class Handler(BaseHTTPRequestHandler):
       if not player:
         self._send_json(400, {"error": "playerName gerekli"})
         return
-      with ROOM_LOCK:
-        room = get_room(room_id)
+      now_ms = clock_ms()
+      room = self._room(room_id)
+      if room is None:
+        return
+      with room["lock"]:
         if player not in room["players"]:
-          room["players"][player] = 0
+          set_score(room, player, 0)
           add_event(room, "system", f"{player} odaya girdi.")
-        mark_presence(room, player)
-        reconcile_room_state(room)
-        self._send_json(200, room_snapshot(room))
+        mark_presence(room, player, now_ms)
+        reconcile_room_state(room, now_ms)
+        state = room_snapshot(room)
+      self._send_json(200, state)
       return
 
     if self.path == "/api/leave":
@@ -495,12 +1277,16 @@ class Handler(BaseHTTPRequestHandler):
       if not player:
         self._send_json(400, {"error": "playerName gerekli"})
         return
-      with ROOM_LOCK:
-        room = get_room(room_id)
-        room["presence"].pop(player, None)
-        room["ready"].discard(player)
-        reconcile_room_state(room)
-        self._send_json(200, room_snapshot(room))
+      now_ms = clock_ms()
+      room = self._room(room_id)
+      if room is None:
+        return
+      with room["lock"]:
+        drop_presence(room, player)
+        set_ready(room, room["ready"] - {player})
+        reconcile_room_state(room, now_ms)
+        state = room_snapshot(room)
+      self._send_json(200, state)
       return
 
     if self.path == "/api/ready":
@@ -508,27 +1294,26 @@ class Handler(BaseHTTPRequestHandler):
       if not player:
         self._send_json(400, {"error": "playerName gerekli"})
         return
-      with ROOM_LOCK:
-        room = get_room(room_id)
+      now_ms = clock_ms()
+      room = self._room(room_id)
+      if room is None:
+        return
+      with room["lock"]:
         if player not in room["players"]:
-          room["players"][player] = 0
-        mark_presence(room, player)
-        reconcile_room_state(room)
+          set_score(room, player, 0)
+        mark_presence(room, player, now_ms)
+        reconcile_room_state(room, now_ms)
         if room["phase"] not in ["lobby", "round_end"]:
-          self._send_json(409, {"error": "Su an hazirlanma asamasi degil", "state": room_snapshot(room)})
-          return
-
-        if player in room["ready"]:
-          self._send_json(200, room_snapshot(room))
-          return
-
-        room["ready"].add(player)
-        add_event(room, "system", f"{player} hazir.")
-
-        if can_start_round(room):
-          start_countdown(room)
-
-        self._send_json(200, room_snapshot(room))
+          status, result = 409, {"error": "Su an hazirlanma asamasi degil", "state": room_snapshot(room)}
+        elif player in room["ready"]:
+          status, result = 200, room_snapshot(room)
+        else:
+          set_ready(room, room["ready"] | {player})
+          add_event(room, "system", f"{player} hazir.")
+          if can_start_round(room):
+            start_countdown(room)
+          status, result = 200, room_snapshot(room)
+      self._send_json(status, result)
       return
 
     if self.path == "/api/answer":
@@ -538,73 +1323,59 @@ class Handler(BaseHTTPRequestHandler):
         self._send_json(400, {"error": "playerName ve answer gerekli"})
         return
 
-      with ROOM_LOCK:
-        room = get_room(room_id)
-        mark_presence(room, player)
-        reconcile_room_state(room)
-        if room["phase"] != "question" or not room["current_question"]:
-          self._send_json(409, {"error": "Su an soru asamasi degil", "state": room_snapshot(room)})
-          return
-        active_q = room["current_question"]
-        attempts = active_q.setdefault("attempt_order", [])
-        if player in attempts:
-          self._send_json(409, {"error": "Yanlis cevap. Bu tur tekrar cevap veremezsin.", "state": room_snapshot(room)})
-          return
-
-        expected_player = active_q.get("expected_player", "")
-        if expected_player and expected_player != player:
-          self._send_json(409, {"error": f"Sira {expected_player} oyuncusunda.", "state": room_snapshot(room)})
-          return
-        if not expected_player:
-          active_q["expected_player"] = player
+      now_ms = clock_ms()
+      room = self._room(room_id)
+      if room is None:
+        return
+      with room["lock"]:
+        active_q, error = claim_answer(room, player, answer_text, now_ms)
+      if error:
+        self._send_json(409, error)
+        return
 
-        question = active_q["question"]
-        canonical = active_q["answer"]
-        correct = evaluate_answer(question, canonical, answer_text)
+      # Bulanik eslesme kilit disinda yapilir; diger istekler beklemez.
+      verdict = local_verdict(active_q["canonical"], active_q["accepted"], answer_text)
+      if verdict is None:
+        verdict = cached_verdict(active_q["judge_cache"], answer_text)
+      with room["lock"]:
+        if verdict is None and _JUDGE_SLOTS.acquire(blocking=False):
+          # Hakem LLM cagrisi istegi bekletmesin; sonuc bir sonraki state sorgusunda gorunur.
+          future = _JUDGE_POOL.submit(resolve_judged_answer, room, active_q, player, answer_text)
+          future.add_done_callback(lambda _: _JUDGE_SLOTS.release())
+        elif verdict is None:
+          # Hakem kuyrugu dolu: hakem hatasinda oldugu gibi cevap yanlis sayilir.
+          settle_answer(room, active_q, player, False)
+        else:
+          settle_answer(room, active_q, player, verdict)
+        state = room_snapshot(room)
+      self._send_json(200, state)
+      return
 
-        add_event(room, "system", f"{player}: {answer_text}")
+    self.send_error(404, "Not found")
 
-        if room["phase"] != "question" or not room["current_question"]:
-          self._send_json(200, room_snapshot(room))
-          return
 
-        if correct:
-          room["players"][player] = room["players"].get(player, 0) + 1
-          active_q["winner"] = player
-          score_line = " | ".join([f"{name}: {score}" for name, score in room["players"].items()])
-          add_event(room, "host", f"Dogru! Turu {player} aldi. (+1 puan)")
-          add_event(room, "host", f"Skor: {score_line}")
-          add_event(room, "host", "3 saniye sonra yeni soru.")
-          room["phase"] = "countdown"
-          room["countdown_end_ms"] = int(time.time() * 1000) + 3000
-          room["current_question"] = None
-          room["generating"] = False
-        else:
-          attempts.append(player)
-          add_event(room, "host", "Yanlis cevap.")
+class PooledHTTPServer(ThreadingHTTPServer):
+  request_queue_size = 128
 
-          other_players = [name for name in active_players(room) if name != player]
-          next_player = other_players[0] if other_players else ""
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.pending = queue.Queue()
+    # Isciler daemon: acik SSE baglantilari kapanisi bekletmez.
+    for index in range(HTTP_WORKERS):
+      threading.Thread(target=self.serve_pending, name=f"http-{index}", daemon=True).start()
 
-          if next_player and next_player not in attempts:
-            active_q["expected_player"] = next_player
-            active_q["turn_deadline_ms"] = int(time.time() * 1000) + TURN_TIMEOUT_MS
-            add_event(room, "host", f"{player} bilemedi. Sira {next_player} oyuncusunda.")
-          else:
-            answer = active_q.get("answer", "")
-            add_event(room, "host", f"Iki taraf da bilemedi. Dogru cevap: {answer}. 3 saniye sonra yeni soru.")
-            room["phase"] = "countdown"
-            room["countdown_end_ms"] = int(time.time() * 1000) + 3000
-            room["current_question"] = None
-            room["generating"] = False
-
-        self._send_json(200, room_snapshot(room))
-      return
+  def serve_pending(self) -> None:
+    while True:
+      request, client_address = self.pending.get()
+      self.process_request_thread(request, client_address)
 
-    self.send_error(404, "Not found")
+  def process_request(self, request, client_address):
+    # Baglanti basina sinirsiz thread yerine sabit boyutlu havuz.
+    self.pending.put((request, client_address))
 
 
 if __name__ == "__main__":
-  server = ThreadingHTTPServer(("0.0.0.0", PORT), Handler)
+  server = PooledHTTPServer(("0.0.0.0", PORT), Handler)
+  threading.Thread(target=room_sweeper, daemon=True).start()
   print(f"Quiz game running on http://localhost:{PORT}")
   server.serve_forever()
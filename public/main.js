@@ -21,8 +21,13 @@ const answerInput = document.getElementById("answerInput");
 const answerBtn = answerForm.querySelector("button");
 
 let playerName = "";
-let pollTimer = null;
+let pollToken = 0;
+let stream = null;
 let joined = false;
+let events = [];
+let lastSeq = 0;
+let phase = "";
+let pollGapMs = 250;
 
 function getStorage(key) {
   try {
@@ -61,6 +66,23 @@ function extractRevealedAnswer(hostMsg) {
   return match ? match[1].trim() : "";
 }
 
+function mergeEvents(state) {
+  // Sunucu yeniden baslarsa sira numarasi geriye duser; bastan al.
+  if (typeof state.seq === "number" && state.seq < lastSeq) {
+    events = [];
+    lastSeq = 0;
+  }
+  for (const evt of state.events || []) {
+    if (evt && evt.id > lastSeq) {
+      events.push(evt);
+      lastSeq = evt.id;
+    }
+  }
+  if (events.length > 120) events = events.slice(-120);
+  // seq olaysiz degisikliklerde de ilerler; since her zaman son gorulen seq olur.
+  if (typeof state.seq === "number") lastSeq = Math.max(lastSeq, state.seq);
+}
+
 function setJoinStatus(text) {
   joinStatus.textContent = text;
 }
@@ -75,9 +97,21 @@ function renderScores(scores) {
   }
 }
 
+function applyCountdown(state) {
+  if (phase === "countdown") countdown.textContent = String(state.countdown || 0);
+  if (phase === "question") countdown.textContent = String(state.questionCountdown || 0);
+}
+
 function applyState(state) {
+  // Sunucu degisiklik yoksa sadece sayaclari yollar.
+  if (state.unchanged) {
+    applyCountdown(state);
+    return;
+  }
+  mergeEvents(state);
+  phase = state.phase;
   renderScores(state.scores || []);
-  const hostMsg = latestHostMessage(state.events || []);
+  const hostMsg = latestHostMessage(events);
   const revealedAnswer = extractRevealedAnswer(hostMsg);
   const currentCategory = (state.question && state.question.category) || "KARIŞIK";
   categoryBadge.textContent = String(currentCategory).toUpperCase();
@@ -122,7 +156,11 @@ function applyState(state) {
       commentText.textContent = state.question.hostComment || "";
       questionCard.classList.remove("hidden");
     }
-    setStatus(hostMsg || "Cevabi ilk dogru veren +1 puan.");
+    if (state.question && state.question.judging) {
+      setStatus(`${state.question.judging} cevabı değerlendiriliyor...`);
+    } else {
+      setStatus(hostMsg || "Cevabi ilk dogru veren +1 puan.");
+    }
   }
 
   if (state.phase === "round_end") {
@@ -142,19 +180,76 @@ function applyState(state) {
 }
 
 async function fetchState() {
-  if (!joined) return;
+  if (!joined) return false;
   try {
     const res = await fetch(
-      `/api/state?roomId=${encodeURIComponent(ROOM_ID)}&playerName=${encodeURIComponent(playerName)}`
+      `/api/state?roomId=${encodeURIComponent(ROOM_ID)}&playerName=${encodeURIComponent(playerName)}&since=${lastSeq}&wait=1`
     );
     const data = await res.json();
     if (!res.ok) throw new Error(data.error || "Durum alinamadi.");
+    // Sunucu long-poll'u tutamadiysa Retry-After yollar; o durumda en az 1 sn bekle.
+    const retryAfter = Number(res.headers.get("Retry-After") || 0);
+    pollGapMs = retryAfter > 0 ? Math.max(1000, retryAfter * 1000) : 250;
     applyState(data);
+    return true;
   } catch (err) {
     setStatus(`Hata: ${err.message}`);
+    return false;
+  }
+}
+
+function sleep(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+function stopUpdates() {
+  if (stream) {
+    stream.close();
+    stream = null;
+  }
+  pollToken += 1;
+}
+
+async function startPolling() {
+  stopUpdates();
+  const token = pollToken;
+  // Long-poll: sunucu degisiklik olana kadar cevabi bekletir, istek hemen yenilenir.
+  while (joined && token === pollToken) {
+    const started = Date.now();
+    const ok = await fetchState();
+    const elapsed = Date.now() - started;
+    if (!ok) {
+      await sleep(1000);
+    } else if (elapsed < pollGapMs) {
+      await sleep(pollGapMs - elapsed);
+    }
   }
 }
 
+function startUpdates() {
+  if (typeof EventSource === "undefined") {
+    startPolling();
+    return;
+  }
+  stopUpdates();
+  stream = new EventSource(
+    `/api/stream?roomId=${encodeURIComponent(ROOM_ID)}&playerName=${encodeURIComponent(playerName)}&since=${lastSeq}`
+  );
+  stream.onmessage = (evt) => {
+    try {
+      applyState(JSON.parse(evt.data));
+    } catch {
+      // no-op
+    }
+  };
+  stream.onerror = () => {
+    // Tarayici kendisi yeniden baglanir; baglanti tamamen kapandiysa sorguya don.
+    if (stream && stream.readyState === EventSource.CLOSED && joined) {
+      startPolling();
+    }
+  };
+}
+
 async function joinGame() {
   const n = nameInput.value.trim();
   if (!n) {
@@ -163,6 +258,8 @@ async function joinGame() {
   }
 
   playerName = n;
+  events = [];
+  lastSeq = 0;
   joinBtn.disabled = true;
   setJoinStatus("Baglaniliyor...");
 
@@ -182,9 +279,7 @@ async function joinGame() {
     gameView.classList.remove("hidden");
 
     applyState(data);
-    if (pollTimer) clearInterval(pollTimer);
-    pollTimer = setInterval(fetchState, 1000);
-    await fetchState();
+    startUpdates();
   } catch (err) {
     setJoinStatus(`Hata: ${err.message}`);
     joinBtn.disabled = false;
@@ -204,10 +299,7 @@ async function leaveGame() {
   }
 
   joined = false;
-  if (pollTimer) {
-    clearInterval(pollTimer);
-    pollTimer = null;
-  }
+  stopUpdates();
   gameView.classList.add("hidden");
   joinView.classList.remove("hidden");
   setJoinStatus("Rakibini bekle.");
@@ -1,9 +1,11 @@
 import json
 import os
 from pathlib import Path
-from urllib import error, request
 
+import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 def load_env_file(path: Path) -> None:
@@ -92,6 +94,24 @@ User Commands:
 - “Kategori: <X>” → Ask a question strictly from that category.
 - “Cevabı söyle” → Reveal the correct answer briefly, then IMMEDIATELY ask a new question."""
 
+SYSTEM_INSTRUCTION = {"parts": [{"text": SYSTEM_PROMPT}]}
+
+
+@st.cache_resource
+def gemini_session() -> requests.Session:
+  # Streamlit her etkilesimde betigi yeniden calistirir; oturum ve TLS baglantisi surec boyunca paylasilir.
+  session = requests.Session()
+  retry = Retry(
+    total=3,
+    backoff_factor=1,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=frozenset({"POST"}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+  )
+  session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+  return session
+
 
 def ask_gemini(history):
   contents = []
@@ -100,28 +120,33 @@ def ask_gemini(history):
     contents.append({"role": role, "parts": [{"text": item["content"]}]})
 
   payload = {
-    "systemInstruction": {"parts": [{"text": SYSTEM_PROMPT}]},
+    "systemInstruction": SYSTEM_INSTRUCTION,
     "contents": contents,
     "generationConfig": {"temperature": 0.9},
   }
 
-  req = request.Request(
-    f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL}:generateContent?key={GEMINI_API_KEY}",
-    data=json.dumps(payload).encode("utf-8"),
-    headers={"Content-Type": "application/json"},
-    method="POST",
+  # SSE akisi: ilk kelimeler tum cevap beklenmeden ekrana gelir.
+  resp = gemini_session().post(
+    f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL}:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}",
+    json=payload,
+    timeout=60,
+    stream=True,
   )
-
-  with request.urlopen(req, timeout=60) as resp:
-    data = json.loads(resp.read().decode("utf-8"))
-
-  candidates = data.get("candidates", [])
-  if not candidates:
-    return ""
-
-  parts = candidates[0].get("content", {}).get("parts", [])
-  texts = [part.get("text", "") for part in parts if part.get("text")]
-  return "\n".join(texts).strip()
+  with resp:
+    if resp.status_code != 200:
+      raise RuntimeError(resp.text)
+    resp.encoding = "utf-8"
+    for line in resp.iter_lines(decode_unicode=True):
+      if not line or not line.startswith("data:"):
+        continue
+      data = json.loads(line[5:])
+      candidates = data.get("candidates", [])
+      if not candidates:
+        continue
+      parts = candidates[0].get("content", {}).get("parts", [])
+      for part in parts:
+        if part.get("text"):
+          yield part["text"]
 
 
 st.set_page_config(page_title="Quiz Gecesi", page_icon="🎤", layout="centered")
@@ -144,19 +169,18 @@ if user_msg:
   with st.chat_message("user"):
     st.write(user_msg)
 
-  if not GEMINI_API_KEY:
-    answer = "GEMINI_API_KEY eksik."
-  else:
-    try:
-      with st.spinner("Host düşünüyor..."):
-        answer = ask_gemini(st.session_state.history)
-      if not answer:
-        answer = "Modelden geçerli cevap alınamadı."
-    except error.HTTPError as http_err:
-      answer = http_err.read().decode("utf-8")
-    except Exception as exc:
-      answer = str(exc)
+  with st.chat_message("assistant"):
+    if not GEMINI_API_KEY:
+      answer = "GEMINI_API_KEY eksik."
+      st.write(answer)
+    else:
+      try:
+        answer = st.write_stream(ask_gemini(st.session_state.history)).strip()
+        if not answer:
+          answer = "Modelden geçerli cevap alınamadı."
+          st.write(answer)
+      except Exception as exc:
+        answer = str(exc)
+        st.write(answer)
 
   st.session_state.history.append({"role": "assistant", "content": answer})
-  with st.chat_message("assistant"):
-    st.write(answer)